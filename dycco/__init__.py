@@ -1 +1,3 @@
-from .dycco import document, parse  # noqa
+from .dycco import (  # noqa
+    document, document_async, document_git_rev, find_sources,
+    iter_documents_async, parse, render, render_async)
@@ -2,12 +2,17 @@ import argparse
 import logging
 import sys
 
-from .dycco import document
+from .dycco import document, document_git_rev
 
 
-def main(paths, output_dir):
+def main(paths, output_dir, include=None, exclude=None, gitignore=False,
+         jobs=1, git_rev=None, reuse_dir=None):
     try:
-        document(paths, output_dir)
+        if git_rev:
+            document_git_rev(git_rev, output_dir, paths, include=include,
+                             exclude=exclude, jobs=jobs, reuse_dir=reuse_dir)
+        else:
+            document(paths, output_dir, include, exclude, gitignore, jobs)
     except IOError as e:
         logging.error('Unable to open file: %s', e)
         return 1
@@ -18,16 +23,57 @@ def main(paths, output_dir):
         return 0
 
 
+def positive_int(value):
+    """An `argparse` type for options that must be a positive integer.
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1: %r' % value)
+    return number
+
+
 if __name__ == '__main__':
     arg_parser = argparse.ArgumentParser(
         prog='dycco',
         description='Literate-style documentation generator.')
     arg_parser.add_argument(
-        'source_file', nargs='+', default=sys.stdin,
-        help='Source files to document')
+        'source_file', nargs='*',
+        help='Source files or directories to document (with --git-rev, '
+             'paths in the revision to limit documentation to)')
     arg_parser.add_argument(
         '-o', '--output-dir', default='docs',
         help='Output directory (will be created if necessary)')
+    arg_parser.add_argument(
+        '-i', '--include', action='append', metavar='PATTERN',
+        help='Glob pattern for files to document when walking directories '
+             '(default: *.py, may be repeated)')
+    arg_parser.add_argument(
+        '-e', '--exclude', action='append', metavar='PATTERN',
+        help='Glob pattern for files or directories to skip (may be '
+             'repeated)')
+    arg_parser.add_argument(
+        '--gitignore', action='store_true',
+        help='Skip files and directories ignored by .gitignore files')
+    arg_parser.add_argument(
+        '-j', '--jobs', type=positive_int, default=1,
+        help='Number of worker processes used to render large files '
+             '(default: 1)')
+    arg_parser.add_argument(
+        '--git-rev', metavar='REV',
+        help='Document the given revision of the current git repository '
+             'without checking it out')
+    arg_parser.add_argument(
+        '--reuse-dir', metavar='DIR',
+        help='With --git-rev, copy docs for unchanged files from this '
+             'earlier output directory instead of rendering them again')
 
     args = arg_parser.parse_args()
-    sys.exit(main(args.source_file, args.output_dir))
+    if not args.source_file and not args.git_rev:
+        arg_parser.error('at least one source file is required')
+    if args.git_rev and args.gitignore:
+        arg_parser.error('--gitignore cannot be used with --git-rev')
+    if args.reuse_dir and not args.git_rev:
+        arg_parser.error('--reuse-dir can only be used with --git-rev')
+    sys.exit(main(args.source_file, args.output_dir, args.include,
+                  args.exclude, args.gitignore, args.jobs, args.git_rev,
+                  args.reuse_dir))
@@ -33,47 +33,68 @@ to [Docco][docco]'s.
 """
 
 import ast
+import asyncio
 import datetime
+import fnmatch
+import hashlib
+import io
+import json
 import os
 import re
 import shutil
+import subprocess
+import tokenize
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import markdown
+import pygments
 import pystache
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name
 from pygments.formatters import HtmlFormatter
 
 
-COMMENT_PATTERN = '^\s*#'
+COMMENT_PATTERN = r'^\s*#'
 
 DYCCO_ROOT = os.path.dirname(__file__)
 DYCCO_RESOURCES = os.path.join(DYCCO_ROOT, 'resources')
 DYCCO_TEMPLATE = os.path.join(DYCCO_RESOURCES, 'template.html')
 DYCCO_CSS = os.path.join(DYCCO_RESOURCES, 'dycco.css')
 
-# For Python 2 & 3 compatibility
-try:
-    string_type = basestring
-except NameError:
-    string_type = str
+# When walking directories, only files matching these patterns are documented
+# unless other `include` patterns are given.
+DEFAULT_INCLUDE = ['*.py']
 
+# Files with fewer lines than this are always rendered serially, because
+# handing their sections to worker processes costs more than it saves.
+PARALLEL_MIN_LINES = 2000
+
+# When documenting a git revision, the blob hash of each documented file is
+# recorded in this file in the output directory, so that unchanged files can
+# be skipped the next time. See `make_render_stamp` for how the manifest is
+# tied to the version of Dycco that wrote it.
+GIT_MANIFEST = '.dycco-blobs.json'
+
+# The default number of files the asynchronous API works on at once.
+ASYNC_CONCURRENCY = 8
 
 ### Documentation Generation
 
-def document(input_paths, output_dir):
+def document(input_paths, output_dir, include=None, exclude=None,
+             gitignore=False, jobs=1):
     """Generates documentation for the Python files at the given `input_paths`
     by parsing each file into pairs of documentation and source code and
     rendering those pairs into an HTML file.
 
     The `input_paths` param can be a `list` of paths or a single `str` path.
-    """
+    Any directories among them are walked recursively; see `find_sources` for
+    the meaning of `include`, `exclude` and `gitignore`. The layout of the
+    input directories is mirrored in `output_dir`.
 
-    # If we get a single path, stick it in a list so we can still pretend
-    # we're operating on multiple paths.
-    if isinstance(input_paths, string_type):
-        input_paths = [input_paths]
+    If `jobs` is greater than one, the sections of large files are rendered
+    in that many worker processes; see `render`.
+    """
 
     # Make sure the directory exists
     if not os.path.exists(output_dir) or not os.path.isdir(output_dir):
@@ -81,21 +102,563 @@ def document(input_paths, output_dir):
 
     # Parse each input file into sections, render the sections as HTML into a
     # string, and create or overwrite the documentation at the appropriate
-    # output path.
-    for input_path in input_paths:
-        filename = os.path.basename(input_path)
-        output_path = make_output_path(filename, output_dir)
-        with open(input_path) as f:
-            src = f.read()
-            sections = parse(src)
-            html = render(filename, sections)
-            with open(output_path, 'w') as f:
-                f.write(html)
+    # output path. Files are rendered as soon as they are found, rather than
+    # waiting for the whole tree to be walked, and a single pool of worker
+    # processes is shared by every file.
+    executor = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        sources = find_sources(input_paths, include, exclude, gitignore)
+        for input_path, relpath in sources:
+            src = read_file(input_path)
+            write_document(src, relpath, output_dir, jobs, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Copy the CSS into the output directory
+    shutil.copy(DYCCO_CSS, output_dir)
+
+
+def write_document(src, relpath, output_dir, jobs=1, executor=None):
+    """Parses and renders the given `src`, and writes the resulting HTML to
+    the output path for `relpath` in `output_dir`.
+    """
+    sections = parse(src)
+    html = render(relpath, sections, make_css_path(relpath), jobs, executor)
+    write_file(make_output_path(relpath, output_dir), html)
+
+
+#### Git Revisions
+
+def document_git_rev(rev, output_dir, paths=None, repo='.', include=None,
+                     exclude=None, jobs=1, reuse_dir=None):
+    """Generates documentation for the Python files in the git revision
+    `rev` of the repository at `repo`, reading them straight out of git's
+    object store instead of a working tree. Only files beneath the given
+    `paths` (relative to the top of the repository) are documented, if any
+    are given; `include` and `exclude` work as in `find_sources`.
+
+    The blob hash of every documented file is recorded in `output_dir`. A
+    file whose blob hash matches the one recorded in `reuse_dir` (which
+    defaults to `output_dir` itself) is not rendered again; its existing
+    output is kept or copied over instead. Documenting a run of releases into
+    sibling directories, reusing each previous one, therefore only costs the
+    files that changed between them. Nothing is reused from a manifest
+    written by a different version of Dycco or its dependencies.
+
+    Docs from an earlier run into `output_dir` for files that are no longer
+    in the revision are removed, but only if they fall within this run's
+    `paths`, `include` and `exclude` selection.
+    """
+
+    # Make sure the directory exists
+    if not os.path.exists(output_dir) or not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    stamp = make_render_stamp()
+    reuse_dir = reuse_dir or output_dir
+    previous_stamp, previous = read_git_manifest(output_dir)
+    reusable_stamp, reusable = read_git_manifest(reuse_dir)
+    if reusable_stamp != stamp:
+        reusable = {}
+    blobs = {}
+
+    # Docs in `output_dir` are about to be overwritten, so the old manifest
+    # stops describing them. Remove it until the run is complete, so that an
+    # interrupted run cannot leave new docs recorded under old blob hashes.
+    manifest_path = os.path.join(output_dir, GIT_MANIFEST)
+    if os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+
+    executor = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        with GitBlobReader(repo) as reader:
+            sources = find_git_sources(rev, paths, repo, include, exclude)
+            for blob, relpath in sources:
+                blobs[relpath] = blob
+                output_path = make_output_path(relpath, output_dir)
+                reuse_path = make_output_path(relpath, reuse_dir)
+                if reusable.get(relpath) == blob and \
+                        os.path.isfile(reuse_path):
+                    if reuse_path != output_path:
+                        output_subdir = os.path.dirname(output_path)
+                        if not os.path.isdir(output_subdir):
+                            os.makedirs(output_subdir)
+                        shutil.copy(reuse_path, output_path)
+                    continue
+                src = reader.read(blob)
+                write_document(src, relpath, output_dir, jobs, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Remove the docs for any files that were documented here before but
+    # are not part of this revision. Docs outside of this run's selection are
+    # left alone, and stay in the manifest if they can still be trusted.
+    for relpath in set(previous) - set(blobs):
+        if is_git_selected(relpath, paths, include, exclude):
+            output_path = make_output_path(relpath, output_dir)
+            if os.path.isfile(output_path):
+                os.remove(output_path)
+        elif previous_stamp == stamp:
+            blobs[relpath] = previous[relpath]
+
+    with open(manifest_path, 'w') as f:
+        json.dump({'stamp': stamp, 'blobs': blobs}, f, indent=2,
+                  sort_keys=True)
 
     # Copy the CSS into the output directory
     shutil.copy(DYCCO_CSS, output_dir)
 
 
+def find_git_sources(rev, paths=None, repo='.', include=None, exclude=None):
+    """Generates `(blob, relpath)` pairs for every file in the git revision
+    `rev` that should be documented, where `blob` is the hash of the file's
+    contents and `relpath` is its path from the top of the repository.
+    """
+    include = include or DEFAULT_INCLUDE
+    exclude = exclude or []
+
+    # `ls-tree` entries look like `<mode> <type> <blob>\t<path>` and are
+    # separated by NUL bytes, so that odd file names come through intact.
+    command = ['git', '-C', repo, 'ls-tree', '-r', '-z', '--full-tree', rev]
+    if paths:
+        command += ['--'] + list(paths)
+    output = subprocess.check_output(command)
+    for entry in output.split(b'\0'):
+        if not entry:
+            continue
+        info, path = entry.split(b'\t', 1)
+        mode, kind, blob = info.decode('ascii').split()
+        # Skip symlinks and submodules, which have no source of their own.
+        if kind != 'blob' or mode == '120000':
+            continue
+        relpath = os.fsdecode(path).replace('/', os.sep)
+        if matches_any(relpath, include) and \
+                not is_excluded(relpath, exclude):
+            yield blob, relpath
+
+
+def is_git_selected(relpath, paths=None, include=None, exclude=None):
+    """Tests whether the given relative path falls within the selection made
+    by the `paths`, `include` and `exclude` arguments of `find_git_sources`.
+    Each of the `paths` is treated as a plain file or directory name, so
+    paths selected by a git pathspec glob are considered outside of it.
+    """
+    if paths:
+        relpath_slash = relpath.replace(os.sep, '/')
+        prefixes = [path.replace(os.sep, '/').strip('/') for path in paths]
+        if not any(relpath_slash == prefix or
+                   relpath_slash.startswith(prefix + '/') or not prefix
+                   for prefix in prefixes):
+            return False
+    return matches_any(relpath, include or DEFAULT_INCLUDE) and \
+        not is_excluded(relpath, exclude or [])
+
+
+def read_git_manifest(output_dir):
+    """Returns the stamp and the `dict` mapping relative paths to blob hashes
+    recorded by a previous `document_git_rev` run in `output_dir`, if any.
+    """
+    try:
+        with open(os.path.join(output_dir, GIT_MANIFEST)) as f:
+            manifest = json.load(f)
+        return manifest['stamp'], manifest['blobs']
+    except (IOError, ValueError, KeyError, TypeError):
+        return None, {}
+
+
+def make_render_stamp():
+    """Returns a hash identifying everything that affects the HTML rendered
+    for a given source file: Dycco's own code, template and CSS, and the
+    versions of Markdown, Pygments and Pystache. Docs recorded with a
+    different stamp are not reused.
+    """
+    stamp = hashlib.sha1()
+    for path in [__file__, DYCCO_TEMPLATE, DYCCO_CSS]:
+        with open(path, 'rb') as f:
+            stamp.update(f.read())
+    for module in [markdown, pygments, pystache]:
+        version = getattr(module, '__version__', '')
+        stamp.update(('%s=%s\n' % (module.__name__, version)).encode('utf-8'))
+    return stamp.hexdigest()
+
+
+class GitBlobReader(object):
+    """Reads the contents of git blobs through a single long-lived
+    `git cat-file --batch` process, rather than starting a new process for
+    every file. Use it as a context manager to make sure the process is shut
+    down.
+    """
+
+    def __init__(self, repo='.'):
+        self.process = subprocess.Popen(
+            ['git', '-C', repo, 'cat-file', '--batch'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def read(self, blob):
+        """Returns the contents of the given blob, decoded according to its
+        PEP 263 coding line or byte order mark, or as UTF-8 otherwise.
+        """
+        self.process.stdin.write(blob.encode('ascii') + b'\n')
+        self.process.stdin.flush()
+
+        # Each object comes back as a `<blob> <type> <size>` header line,
+        # followed by exactly `size` bytes of content and a newline.
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            raise IOError('Unable to read git object %s' % blob)
+        size = int(header[2])
+        data = self.process.stdout.read(size)
+        self.process.stdout.read(1)
+        encoding = tokenize.detect_encoding(io.BytesIO(data).readline)[0]
+        return data.decode(encoding)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+#### Asynchronous API
+
+async def document_async(input_paths, output_dir, include=None, exclude=None,
+                         gitignore=False, executor=None,
+                         concurrency=ASYNC_CONCURRENCY):
+    """A coroutine version of `document`, for use from `asyncio`
+    applications. Files are read, rendered and written without blocking the
+    event loop; see `iter_documents_async` for the meaning of `executor` and
+    `concurrency`.
+    """
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1, got %r' %
+                         concurrency)
+
+    loop = asyncio.get_running_loop()
+
+    # Make sure the directory exists
+    if not os.path.exists(output_dir) or not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    documents = iter_documents_async(input_paths, include, exclude, gitignore,
+                                     executor, concurrency)
+    async for relpath, html in documents:
+        output_path = make_output_path(relpath, output_dir)
+        await loop.run_in_executor(None, write_file, output_path, html)
+
+    # Copy the CSS into the output directory
+    await loop.run_in_executor(None, shutil.copy, DYCCO_CSS, output_dir)
+
+
+async def iter_documents_async(input_paths, include=None, exclude=None,
+                               gitignore=False, executor=None,
+                               concurrency=ASYNC_CONCURRENCY):
+    """An asynchronous iterator over `(relpath, html)` pairs for the files
+    found by `find_sources`, yielded in the order they finish rendering.
+
+    Walking directories and reading files happen in the event loop's default
+    executor, while parsing and rendering happen in the given `executor`
+    (the default one, if not given). At most `concurrency` files are in
+    flight at any time, counting any rendered but not yet consumed, so it
+    must be at least one. Closing the iterator or cancelling the task
+    consuming it cancels any work still in progress.
+    """
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1, got %r' %
+                         concurrency)
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    results = asyncio.Queue()
+    tasks = set()
+
+    async def render_file(path, relpath):
+        try:
+            src = await loop.run_in_executor(None, read_file, path)
+            html = await render_async(src, relpath, make_css_path(relpath),
+                                      executor)
+            results.put_nowait((relpath, html))
+        except Exception as e:
+            results.put_nowait(e)
+
+    # Files are handed off for rendering as soon as they are found, once a
+    # slot is free. A `None` in the results marks the end of the walk.
+    async def walk():
+        try:
+            sources = find_sources(input_paths, include, exclude, gitignore)
+            while True:
+                await slots.acquire()
+                source = await loop.run_in_executor(None, next, sources, None)
+                if source is None:
+                    break
+                task = asyncio.ensure_future(render_file(*source))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+            results.put_nowait(None)
+        except Exception as e:
+            results.put_nowait(e)
+
+    walker = asyncio.ensure_future(walk())
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            if isinstance(result, Exception):
+                raise result
+            # The slot is only freed once the consumer asks for the next
+            # result, so unconsumed results count against `concurrency`.
+            yield result
+            slots.release()
+    finally:
+        walker.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+async def render_async(src, title='', css_path='dycco.css', executor=None):
+    """Parses and renders the given `src` into HTML in the given `executor`
+    (the event loop's default one, if not given), without blocking the event
+    loop. Use a `ProcessPoolExecutor` to keep rendering off the event loop's
+    process entirely.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, render_source, src, title,
+                                      css_path)
+
+
+def render_source(src, title='', css_path='dycco.css'):
+    """Parses and renders the given `src` into HTML in one go.
+    """
+    return render(title, parse(src), css_path)
+
+
+def read_file(path):
+    """Returns the contents of the file at `path`.
+    """
+    with open(path) as f:
+        return f.read()
+
+
+def write_file(path, contents):
+    """Writes `contents` to the file at `path`, creating its directory if
+    necessary.
+    """
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(path, 'w') as f:
+        f.write(contents)
+
+
+### Finding the Source
+
+def find_sources(input_paths, include=None, exclude=None, gitignore=False):
+    """Generates `(path, relpath)` pairs for every source file to document,
+    where `relpath` is the file's path relative to the common root of all of
+    the `input_paths` and is used to build its output path.
+
+    Files named explicitly in `input_paths` are always documented. Directories
+    are walked recursively, yielding files whose name or relative path match
+    one of the `include` glob patterns (`DEFAULT_INCLUDE` by default).
+    Anything matching one of the `exclude` patterns is skipped, and excluded
+    directories are not descended into. See `matches_any` for how patterns
+    are matched. If `gitignore` is true, files and directories ignored by any
+    `.gitignore` found along the way are skipped too. As with `os.walk`,
+    symlinks to directories are not followed.
+
+    Paths are generated lazily while walking, so very large trees can be
+    processed before the walk is complete.
+    """
+    # If we get a single path, stick it in a list so we can still pretend
+    # we're operating on multiple paths.
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+
+    include = include or DEFAULT_INCLUDE
+    exclude = exclude or []
+
+    # Output paths are made relative to the deepest directory containing all
+    # of the inputs, so that `a/utils.py` and `b/utils.py` do not clobber
+    # each other, while `pkg/*.py` still ends up at the top of the output.
+    root = find_common_root(input_paths)
+
+    for input_path in input_paths:
+        if os.path.isdir(input_path):
+            base = os.path.relpath(os.path.abspath(input_path), root)
+            if base == os.curdir:
+                base = ''
+            for path, relpath in walk_sources(input_path, base, include,
+                                              exclude, gitignore, []):
+                yield path, relpath
+        else:
+            yield input_path, os.path.relpath(os.path.abspath(input_path),
+                                              root)
+
+
+def walk_sources(top, base, include, exclude, gitignore, rules):
+    """Recursively walks the directory `top` with `os.scandir`, generating
+    `(path, relpath)` pairs for the files that should be documented. The
+    `relpath` of each file is joined onto `base`, and `rules` holds any
+    `.gitignore` rules inherited from parent directories.
+    """
+    # Pick up this directory's `.gitignore`, whose patterns only apply to
+    # paths beneath it.
+    if gitignore:
+        gitignore_path = os.path.join(top, '.gitignore')
+        if os.path.isfile(gitignore_path):
+            rules = rules + parse_gitignore(gitignore_path, base)
+
+    # Sort the entries so the output order does not depend on the
+    # filesystem, then recurse into directories as they come up.
+    with os.scandir(top) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        relpath = os.path.join(base, entry.name)
+        # Do not follow symlinked directories, which may loop back on
+        # themselves.
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if gitignore and (entry.name == '.git' or
+                          is_gitignored(relpath, is_dir, rules)):
+            continue
+        if matches_any(relpath, exclude, is_dir):
+            continue
+        if is_dir:
+            for source in walk_sources(entry.path, relpath, include, exclude,
+                                       gitignore, rules):
+                yield source
+        elif entry.is_file() and matches_any(relpath, include):
+            yield entry.path, relpath
+
+
+def find_common_root(input_paths):
+    """Returns the absolute path of the deepest directory containing all of
+    the given `input_paths`.
+    """
+    dirs = [os.path.abspath(path) if os.path.isdir(path)
+            else os.path.dirname(os.path.abspath(path))
+            for path in input_paths]
+    return os.path.commonpath(dirs) if dirs else os.getcwd()
+
+
+def matches_any(relpath, patterns, is_dir=False):
+    """Tests whether the given relative path matches any of the given glob
+    `patterns`, with `/` as the path separator. Patterns without a `/` are
+    matched against the file name; the others are matched against the full
+    relative path by `match_path`. As in `.gitignore`, a pattern with a
+    trailing `/` only matches directories, so `is_dir` says whether
+    `relpath` is one.
+    """
+    relpath = relpath.replace(os.sep, '/')
+    name = relpath.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        if pattern.endswith('/'):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip('/')
+        if match_path(relpath, pattern) or \
+                ('/' not in pattern and fnmatch.fnmatchcase(name, pattern)):
+            return True
+    return False
+
+
+def match_path(path, pattern):
+    """Tests whether the `/`-separated `path` matches the glob `pattern` one
+    path segment at a time, so that `*`, `?` and `[...]` never match a `/`.
+    As in git, a `**` segment matches any number of directories, so `a/**/b`
+    matches `a/b` and `a/x/y/b`, while a trailing `/**` matches everything
+    inside a directory.
+    """
+    return match_segments(path.split('/'), pattern.split('/'))
+
+
+def match_segments(parts, patterns):
+    """Matches a list of path segments against a list of pattern segments;
+    see `match_path`.
+    """
+    if not patterns:
+        return not parts
+    if patterns[0] == '**':
+        # A trailing `**` only matches something inside the directory, not
+        # the directory itself.
+        if len(patterns) == 1:
+            return bool(parts)
+        return any(match_segments(parts[i:], patterns[1:])
+                   for i in range(len(parts) + 1))
+    return bool(parts) and fnmatch.fnmatchcase(parts[0], patterns[0]) and \
+        match_segments(parts[1:], patterns[1:])
+
+
+def is_excluded(relpath, exclude):
+    """Tests whether the given relative path, or any of the directories it
+    is in, matches one of the `exclude` patterns.
+    """
+    parts = relpath.split(os.sep)
+    return any(matches_any(os.sep.join(parts[:i]), exclude, i < len(parts))
+               for i in range(1, len(parts) + 1))
+
+
+#### Ignore Files
+
+def parse_gitignore(path, base):
+    """Parses the `.gitignore` file at `path`, which lives in the directory
+    `base` (relative to the walk's root), into a `list` of rules. Each rule is
+    a `(base, pattern, negated, dir_only, anchored)` tuple.
+
+    Comments, `!` negation, trailing `/` for directory-only patterns,
+    patterns anchored by a leading or embedded `/` and `**` segments are
+    supported. Backslash escapes (including escaped trailing spaces and
+    leading `#` or `!`) and the ignore files that live outside the tree
+    (`.git/info/exclude` and `core.excludesFile`) are not.
+    """
+    base = base.replace(os.sep, '/')
+    rules = []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            line = line.lstrip('/')
+            if line:
+                rules.append((base, line, negated, dir_only, anchored))
+    return rules
+
+
+def is_gitignored(relpath, is_dir, rules):
+    """Tests whether the given relative path is ignored by the given
+    `.gitignore` `rules`. As in git, the last matching rule wins.
+    """
+    relpath = relpath.replace(os.sep, '/')
+    ignored = False
+    for base, pattern, negated, dir_only, anchored in rules:
+        if dir_only and not is_dir:
+            continue
+        if base:
+            if not relpath.startswith(base + '/'):
+                continue
+            path = relpath[len(base) + 1:]
+        else:
+            path = relpath
+        if not anchored:
+            path = path.rsplit('/', 1)[-1]
+        if match_path(path, pattern):
+            ignored = not negated
+    return ignored
+
+
 ### Parsing the Source
 
 def parse(src):
@@ -228,24 +791,33 @@ def parse_code(src, sections, skip_lines=set()):
 
 ### Rendering
 
-def render(title, sections):
+def render(title, sections, css_path='dycco.css', jobs=1, executor=None):
     """Renders the given sections, which should be the result of calling
-    `parse` on a source code file, into HTML.
+    `parse` on a source code file, into HTML. The stylesheet is linked to at
+    `css_path`, relative to the HTML file.
+
+    If `jobs` is greater than one and the file has at least
+    `PARALLEL_MIN_LINES` lines, its sections are split into `jobs` chunks of
+    roughly equal line counts and rendered by worker processes, either from
+    the given `executor` or from a pool created just for this file. The
+    output is identical to a serial render.
     """
     # Transform the `sections` `dict` we were given into a format suitable for
     # our Mustache template. Along the way, preprocess each block of
     # documentation and code, via Markdown and Pygments.
-    sections = [{
-        'num': key,
-        'docs_html': preprocess_docs(value['docs']),
-        'code_html': preprocess_code(value['code'])
-    } for key, value in sorted(sections.items())]
+    items = sorted(sections.items())
+    if jobs > 1 and sum(count_lines(value) for key, value in items) \
+            >= PARALLEL_MIN_LINES:
+        sections = render_sections_parallel(items, jobs, executor)
+    else:
+        sections = render_sections(items)
 
     # We include a timestamp in the footer.
     date = datetime.datetime.utcnow().strftime('%d %b %Y')
 
     context = {
         'title': title,
+        'css_path': css_path,
         'sections': sections,
         'date': date,
         }
@@ -253,6 +825,60 @@ def render(title, sections):
         return pystache.render(f.read(), context)
 
 
+def render_sections(items):
+    """Preprocesses the docs and code of each `(num, section)` pair in
+    `items` into the `dict`s expected by our Mustache template.
+    """
+    return [{
+        'num': key,
+        'docs_html': preprocess_docs(value['docs']),
+        'code_html': preprocess_code(value['code'])
+    } for key, value in items]
+
+
+def render_sections_parallel(items, jobs, executor=None):
+    """Like `render_sections`, but splits `items` into `jobs` contiguous
+    chunks and preprocesses each chunk in a worker process. The chunks are
+    reassembled in their original order.
+    """
+    chunks = split_sections(items, jobs)
+    if executor is None:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(render_sections, chunks))
+    else:
+        results = list(executor.map(render_sections, chunks))
+    return [section for result in results for section in result]
+
+
+def split_sections(items, count):
+    """Splits the sorted `(num, section)` pairs in `items` into at most
+    `count` contiguous chunks, balanced by the number of lines in each.
+    """
+    total = sum(count_lines(value) for key, value in items)
+    chunks = []
+    chunk = []
+    lines = 0
+    for key, value in items:
+        chunk.append((key, value))
+        lines += count_lines(value)
+        # Close the chunk once it brings us up to its share of the total,
+        # leaving anything left over for the last chunk.
+        if len(chunks) < count - 1 and \
+                lines * count >= total * (len(chunks) + 1):
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def count_lines(section):
+    """Counts the lines of docs and code in the given section.
+    """
+    docs = sum(len(doc.splitlines()) for doc in section['docs'] if doc)
+    return docs + len(section['code'])
+
+
 #### Preprocessors
 
 def preprocess_docs(docs):
@@ -307,14 +933,34 @@ def should_filter(line, num):
 def make_output_path(filename, output_dir):
     """Creates an appropriate output path for the given source file and output
     directory. The output file name will be the name of the source file
-    without its extension.
+    without its extension. If `filename` is a relative path, its directories
+    are mirrored under `output_dir`.
     """
     name, ext = os.path.splitext(filename)
     return os.path.join(output_dir, '%s.html' % name)
 
 
+def make_css_path(filename):
+    """Creates the path to the stylesheet, which lives at the top of the
+    output directory, relative to the output for the given source file.
+    """
+    dirname = os.path.dirname(os.path.normpath(filename))
+    if not dirname:
+        return 'dycco.css'
+    return '../' * len(dirname.split(os.sep)) + 'dycco.css'
+
+
 #### AST Parsing
 
+def definition_start_line(node):
+    """Returns the 0-based line number where the given function or class
+    definition starts, including any decorators. Since Python 3.8, a
+    definition's own `lineno` is that of its `def` or `class` keyword.
+    """
+    return min([node.lineno] +
+               [decorator.lineno for decorator in node.decorator_list]) - 1
+
+
 class DocStringVisitor(ast.NodeVisitor):
     """A `NodeVisitor` subclass that walks an Abstract Syntax Tree and gathers
     up and notes the positions of any docstrings it finds.
@@ -347,7 +993,7 @@ class DocStringVisitor(ast.NodeVisitor):
         # def when rendering.
         if isinstance(node, (ast.FunctionDef, ast.ClassDef))\
                 and not self.current_doc:
-            self.docstrings[node.lineno - 1] = None
+            self.docstrings[definition_start_line(node)] = None
         super(DocStringVisitor, self).generic_visit(node)
 
     # Use the `_visit_docstring_node` method when visiting all of these nodes.
@@ -364,8 +1010,9 @@ class DocStringVisitor(ast.NodeVisitor):
                 self.current_node and self.current_doc:
 
             # Figure out where the docstring *ends*, accounting for 0-based
-            # line numbers.
-            end_line = node.lineno - 1
+            # line numbers. Python 3.8 and later record where each node ends;
+            # before that, the `lineno` of a string was its last line.
+            end_line = getattr(node, 'end_lineno', node.lineno) - 1
 
             # We need to know how many lines are in the docstring to figure
             # out where it actually starts.
@@ -384,7 +1031,7 @@ class DocStringVisitor(ast.NodeVisitor):
             # multiple lines.
             else:
                 start_line = end_line - (line_count - 1)
-                target_line = self.current_node.lineno - 1
+                target_line = definition_start_line(self.current_node)
 
             # Mark the positions of this node and its documentation.
             assert target_line not in self.docstrings
@@ -1,4 +1,4 @@
 # Shebang must come first
 #!/usr/bin/env/python2.6
 # -*- coding: utf8 -*-
-print 'Hello, World!'
\ No newline at end of file
+print('Hello, World!')
\ No newline at end of file
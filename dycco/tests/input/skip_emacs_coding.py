@@ -1,2 +1,2 @@
 # -*- coding: utf8 -*-
-print 'Hello, World!'
\ No newline at end of file
+print('Hello, World!')
\ No newline at end of file
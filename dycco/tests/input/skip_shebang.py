@@ -1,2 +1,2 @@
 #!/usr/bin/env python2.6
-print 'Hello, World!'
\ No newline at end of file
+print('Hello, World!')
\ No newline at end of file
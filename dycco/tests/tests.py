@@ -1,4 +1,15 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+
+import dycco
 from utils import with_setup
 
 
@@ -8,32 +19,32 @@ class ParserTests(unittest.TestCase):
     def test_skip_shebang(self):
         self.assertEqual(
             self.results,
-            {1: {'docs': [], 'code': ["print 'Hello, World!'"]}})
+            {1: {'docs': [], 'code': ["print('Hello, World!')"]}})
 
     @with_setup
     def test_skip_coding(self):
         self.assertEqual(
             self.results,
-            {1: {'docs': [], 'code': ["print 'Hello, World!'"]}})
+            {1: {'docs': [], 'code': ["print('Hello, World!')"]}})
 
     @with_setup
     def test_skip_emacs_coding(self):
         self.assertEqual(
             self.results,
-            {1: {'docs': [], 'code': ["print 'Hello, World!'"]}})
+            {1: {'docs': [], 'code': ["print('Hello, World!')"]}})
 
     @with_setup
     def test_skip_shebang_and_coding(self):
         self.assertEqual(
             self.results,
-            {2: {'docs': [], 'code': ["print 'Hello, World!'"]}})
+            {2: {'docs': [], 'code': ["print('Hello, World!')"]}})
 
     @with_setup
     def test_bad_shebang_and_coding(self):
         self.assertEqual(
             self.results,
             {3: {'docs': ['Shebang must come first\n!/usr/bin/env/python2.6\n -*- coding: utf8 -*-'],
-                 'code': ["print 'Hello, World!'"]}})
+                 'code': ["print('Hello, World!')"]}})
 
     @with_setup
     def test_module_docstring(self):
@@ -87,7 +98,7 @@ class ParserTests(unittest.TestCase):
                         '@wraps(bar)',
                         'def decorated_function_definition(function, which, takes, many, args, whose,',
                         '                                  definition, wraps, across, multiple, lines):',
-                        "    print 'Hello!'"]},
+                        "    print('Hello!')"]},
              78: {'docs': ['A long function definition with some very important documentation.'],
                   'code': ['def really_long_function_definition(function, which, takes, many, args, whose,',
                            '                                    definition, wraps, across, multiple,',
@@ -118,5 +129,342 @@ class ParserTests(unittest.TestCase):
                            '']}})
 
 
+class SourceTreeTestCase(unittest.TestCase):
+    """Sets up a small tree of source files in a temporary directory.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for path in ['a/utils.py', 'b/utils.py', 'b/data.txt',
+                     'build/gen.py', 'c/skip.py', 'c/keep.py']:
+            self.write(path, 'x = 1\n')
+        self.write('.gitignore', 'build/\n')
+        self.write('c/.gitignore', '*.py\n!keep.py\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, contents):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+
+
+class FindSourcesTests(SourceTreeTestCase):
+
+    def relpaths(self, *args, **kwargs):
+        return [relpath.replace(os.sep, '/') for path, relpath
+                in dycco.find_sources(*args, **kwargs)]
+
+    def test_walk_directory(self):
+        self.assertEqual(
+            self.relpaths(self.root),
+            ['a/utils.py', 'b/utils.py', 'build/gen.py', 'c/keep.py',
+             'c/skip.py'])
+
+    def test_include_and_exclude(self):
+        self.assertEqual(
+            self.relpaths(self.root, include=['*.txt', 'a/*.py'],
+                          exclude=['b']),
+            ['a/utils.py'])
+
+    def test_exclude_directories_only(self):
+        self.write('d/build', 'not a directory\n')
+        self.assertEqual(
+            self.relpaths(self.root, include=['*.py', 'build'],
+                          exclude=['build/', 'a/']),
+            ['b/utils.py', 'c/keep.py', 'c/skip.py', 'd/build'])
+
+    def test_gitignore(self):
+        self.assertEqual(
+            self.relpaths(self.root, gitignore=True),
+            ['a/utils.py', 'b/utils.py', 'c/keep.py'])
+
+    def test_patterns_match_per_segment(self):
+        self.write('a/sub/deep.py', 'x = 1\n')
+        self.assertEqual(
+            self.relpaths(self.root, include=['a/*.py']), ['a/utils.py'])
+        self.assertEqual(
+            self.relpaths(self.root, include=['a/**/*.py']),
+            ['a/sub/deep.py', 'a/utils.py'])
+
+    def test_gitignore_anchored_patterns(self):
+        self.write('a/sub/deep.py', 'x = 1\n')
+        self.write('.gitignore', 'a/*.py\nc/**\n')
+        self.assertEqual(
+            self.relpaths(self.root, gitignore=True),
+            ['a/sub/deep.py', 'b/utils.py', 'build/gen.py', 'c/keep.py'])
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'requires symlinks')
+    def test_symlink_loop(self):
+        os.symlink(os.pardir, os.path.join(self.root, 'a', 'loop'))
+        self.assertEqual(
+            self.relpaths(self.root),
+            ['a/utils.py', 'b/utils.py', 'build/gen.py', 'c/keep.py',
+             'c/skip.py'])
+
+    def test_explicit_files_are_mirrored(self):
+        paths = [os.path.join(self.root, 'a', 'utils.py'),
+                 os.path.join(self.root, 'b', 'utils.py')]
+        self.assertEqual(self.relpaths(paths), ['a/utils.py', 'b/utils.py'])
+        self.assertEqual(self.relpaths(paths[0]), ['utils.py'])
+
+    def test_document_mirrors_output(self):
+        output_dir = os.path.join(self.root, 'docs')
+        dycco.document(os.path.join(self.root, 'a'), output_dir)
+        dycco.document([os.path.join(self.root, 'a'),
+                        os.path.join(self.root, 'b')], output_dir)
+        for path in ['utils.html', 'a/utils.html', 'b/utils.html',
+                     'dycco.css']:
+            self.assertTrue(os.path.isfile(os.path.join(output_dir, path)))
+        with open(os.path.join(output_dir, 'a', 'utils.html')) as f:
+            self.assertIn('href="../dycco.css"', f.read())
+
+
+class AsyncTests(SourceTreeTestCase):
+
+    def test_render_async(self):
+        src = 'x = 1\n'
+        html = asyncio.run(dycco.render_async(src, 'x.py'))
+        self.assertEqual(html, dycco.render('x.py', dycco.parse(src)))
+
+    def test_iter_documents_async(self):
+        async def collect():
+            return [relpath.replace(os.sep, '/') async for relpath, html
+                    in dycco.iter_documents_async(self.root, concurrency=2)]
+        self.assertEqual(
+            sorted(asyncio.run(collect())),
+            ['a/utils.py', 'b/utils.py', 'build/gen.py', 'c/keep.py',
+             'c/skip.py'])
+
+    def test_iter_documents_async_errors(self):
+        self.write('bad.py', 'def (\n')
+
+        async def collect():
+            return [document async for document
+                    in dycco.iter_documents_async(self.root)]
+        self.assertRaises(SyntaxError, asyncio.run, collect())
+
+    def test_concurrency_limit(self):
+        for i in range(10):
+            self.write('d/mod%d.py' % i, 'x = %d\n' % i)
+        lock = threading.Lock()
+        counts = {'in_flight': 0, 'peak': 0}
+
+        # Files count as in flight from the moment rendering starts until
+        # the consumer has received them.
+        def render_source(src, title='', css_path='dycco.css'):
+            with lock:
+                counts['in_flight'] += 1
+                counts['peak'] = max(counts['peak'], counts['in_flight'])
+            time.sleep(0.02)
+            return title
+
+        async def consume():
+            async for relpath, html in dycco.iter_documents_async(
+                    self.root, concurrency=3):
+                await asyncio.sleep(0.01)
+                with lock:
+                    counts['in_flight'] -= 1
+
+        with mock.patch.object(dycco.dycco, 'render_source', render_source):
+            asyncio.run(consume())
+        self.assertEqual(counts['in_flight'], 0)
+        self.assertEqual(counts['peak'], 3)
+
+    def test_invalid_concurrency(self):
+        async def consume():
+            async for document in dycco.iter_documents_async(
+                    self.root, concurrency=0):
+                pass
+        self.assertRaises(ValueError, asyncio.run, consume())
+
+    def test_cancellation(self):
+        release = threading.Event()
+
+        def render_source(src, title='', css_path='dycco.css'):
+            release.wait(5)
+            return title
+
+        async def cancel():
+            async def consume():
+                async for document in dycco.iter_documents_async(self.root):
+                    pass
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            for i in range(5):
+                await asyncio.sleep(0)
+            pending = asyncio.all_tasks() - {asyncio.current_task()}
+            release.set()
+            return pending
+
+        with mock.patch.object(dycco.dycco, 'render_source', render_source):
+            self.assertEqual(asyncio.run(cancel()), set())
+
+    def test_document_async(self):
+        output_dir = os.path.join(self.root, 'docs')
+        asyncio.run(dycco.document_async(self.root, output_dir,
+                                         gitignore=True))
+        for path in ['a/utils.html', 'b/utils.html', 'c/keep.html',
+                     'dycco.css']:
+            self.assertTrue(os.path.isfile(os.path.join(output_dir, path)))
+
+
+class ParallelRenderTests(unittest.TestCase):
+
+    def setUp(self):
+        # Enough functions to push the source past `PARALLEL_MIN_LINES`.
+        self.src = '\n'.join(
+            '# Section %d\ndef f%d(x):\n    \"\"\"Doc *%d*.\"\"\"\n'
+            '    return x\n\n' % (i, i, i)
+            for i in range(dycco.dycco.PARALLEL_MIN_LINES // 5))
+        self.sections = dycco.parse(self.src)
+
+    def test_split_sections(self):
+        # Many short sections followed by a few long ones, so that splitting
+        # by section count rather than line count would be badly unbalanced.
+        sizes = [1] * 200 + [60] * 10 + [5] * 40
+        items = [(i, {'docs': ['Doc.'], 'code': ['x'] * (size - 1)})
+                 for i, size in enumerate(sizes)]
+        chunks = dycco.dycco.split_sections(items, 4)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual([item for chunk in chunks for item in chunk], items)
+        totals = [sum(dycco.dycco.count_lines(value) for key, value in chunk)
+                  for chunk in chunks]
+        self.assertEqual(sum(totals), sum(sizes))
+        # Each chunk is within one section's worth of lines of its share.
+        for lines in totals:
+            self.assertTrue(abs(lines - sum(sizes) / 4) <= max(sizes), totals)
+
+    def test_matches_serial_render(self):
+        self.assertEqual(
+            dycco.render('big.py', self.sections, jobs=3),
+            dycco.render('big.py', self.sections))
+
+
+class GitRevTests(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.repo = os.path.join(self.root, 'repo')
+        os.makedirs(os.path.join(self.repo, 'pkg'))
+        self.git('init', '-q')
+        self.commit('v1', {'pkg/a.py': 'a = 1\n', 'pkg/b.py': 'b = 1\n',
+                           'README': 'Hello\n'})
+        self.commit('v2', {'pkg/b.py': 'b = 2\n'})
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def git(self, *args):
+        return subprocess.check_output(
+            ('git', '-C', self.repo, '-c', 'user.name=Dycco',
+             '-c', 'user.email=dycco@example.com') + args)
+
+    def commit(self, tag, files):
+        for path, contents in files.items():
+            path = os.path.join(self.repo, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(contents)
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', tag)
+        self.git('tag', tag)
+
+    def test_find_git_sources(self):
+        blob = self.git('rev-parse', 'v1:pkg/a.py').decode('ascii').strip()
+        sources = list(dycco.dycco.find_git_sources('v1', repo=self.repo))
+        self.assertEqual([relpath for blob, relpath in sources],
+                         [os.path.join('pkg', 'a.py'),
+                          os.path.join('pkg', 'b.py')])
+        self.assertEqual(sources[0][0], blob)
+        self.assertEqual(list(dycco.dycco.find_git_sources(
+            'v1', repo=self.repo, exclude=['pkg/'])), [])
+        with dycco.dycco.GitBlobReader(self.repo) as reader:
+            self.assertEqual(reader.read(blob), 'a = 1\n')
+            self.assertRaises(IOError, reader.read, '0' * 40)
+
+    def test_reuse_unchanged_files(self):
+        v1 = os.path.join(self.root, 'v1')
+        v2 = os.path.join(self.root, 'v2')
+        dycco.document_git_rev('v1', v1, repo=self.repo)
+        # Mark the v1 output, so we can tell whether it was copied or
+        # rendered again.
+        with open(os.path.join(v1, 'pkg', 'a.html'), 'a') as f:
+            f.write('<!-- v1 -->')
+        dycco.document_git_rev('v2', v2, repo=self.repo, reuse_dir=v1)
+        with open(os.path.join(v2, 'pkg', 'a.html')) as f:
+            self.assertIn('<!-- v1 -->', f.read())
+        with open(os.path.join(v2, 'pkg', 'b.html')) as f:
+            self.assertIn('<span class="mi">2</span>', f.read())
+
+    def test_interrupted_run(self):
+        self.commit('v3', {'pkg/a.py': 'a = 2\n', 'pkg/z.py': 'def (\n'})
+        output_dir = os.path.join(self.root, 'docs')
+        dycco.document_git_rev('v1', output_dir, repo=self.repo)
+        # `pkg/a.html` is rewritten before `pkg/z.py` fails to parse.
+        self.assertRaises(SyntaxError, dycco.document_git_rev, 'v3',
+                          output_dir, repo=self.repo)
+        dycco.document_git_rev('v1', output_dir, repo=self.repo)
+        with open(os.path.join(output_dir, 'pkg', 'a.html')) as f:
+            self.assertIn('<span class="mi">1</span>', f.read())
+
+    def test_ignore_manifest_from_other_version(self):
+        v1 = os.path.join(self.root, 'v1')
+        dycco.document_git_rev('v1', v1, repo=self.repo)
+        manifest_path = os.path.join(v1, dycco.dycco.GIT_MANIFEST)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest['stamp'] = 'old'
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        with open(os.path.join(v1, 'pkg', 'a.html'), 'a') as f:
+            f.write('<!-- old -->')
+        dycco.document_git_rev('v1', v1, repo=self.repo)
+        with open(os.path.join(v1, 'pkg', 'a.html')) as f:
+            self.assertNotIn('<!-- old -->', f.read())
+
+    def test_cleanup_respects_selection(self):
+        self.commit('v3', {'other/c.py': 'c = 1\n'})
+        output_dir = os.path.join(self.root, 'docs')
+        dycco.document_git_rev('v3', output_dir, paths=['pkg'],
+                               repo=self.repo)
+        dycco.document_git_rev('v3', output_dir, paths=['other'],
+                               repo=self.repo)
+        self.assertTrue(
+            os.path.isfile(os.path.join(output_dir, 'pkg', 'a.html')))
+        self.assertTrue(
+            os.path.isfile(os.path.join(output_dir, 'other', 'c.html')))
+        self.assertEqual(
+            sorted(dycco.dycco.read_git_manifest(output_dir)[1]),
+            [os.path.join('other', 'c.py'), os.path.join('pkg', 'a.py'),
+             os.path.join('pkg', 'b.py')])
+
+        # Files removed from the selected paths are still cleaned up.
+        self.git('rm', '-q', 'pkg/a.py')
+        self.git('commit', '-q', '-m', 'v4')
+        dycco.document_git_rev('HEAD', output_dir, paths=['pkg'],
+                               repo=self.repo)
+        self.assertFalse(
+            os.path.isfile(os.path.join(output_dir, 'pkg', 'a.html')))
+        self.assertTrue(
+            os.path.isfile(os.path.join(output_dir, 'other', 'c.html')))
+
+    def test_coding_line(self):
+        src = u'# -*- coding: latin-1 -*-\nname = "caf\xe9"\n'
+        with open(os.path.join(self.repo, 'pkg', 'c.py'), 'wb') as f:
+            f.write(src.encode('latin-1'))
+        self.git('add', '.')
+        blob = self.git('hash-object', 'pkg/c.py').decode('ascii').strip()
+        with dycco.dycco.GitBlobReader(self.repo) as reader:
+            self.assertEqual(reader.read(blob), src)
+
+
 if __name__ == '__main__':
     unittest.main()